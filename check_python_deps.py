@@ -50,6 +50,9 @@ def main():
     deps_ok &= check_dependency("numpy")
     deps_ok &= check_tesseract()
     
+    # Optional dependencies
+    check_dependency("tesserocr", required=False)  # Faster in-process Tesseract
+    
     print("\nCheck complete!")
     
     if deps_ok:
@@ -15,7 +15,14 @@ Output:
 import sys
 import os
 import json
+import hashlib
+import heapq
+import multiprocessing
 import re
+import shlex
+import subprocess
+import tempfile
+from collections import OrderedDict
 from pathlib import Path
 
 try:
@@ -30,6 +37,13 @@ except ImportError as e:
     }), file=sys.stderr)
     sys.exit(1)
 
+# tesserocr is optional: it keeps one Tesseract instance loaded across images
+# instead of starting the tesseract CLI (and reloading its models) per call
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
 # Configure Tesseract path for Windows if needed
 if sys.platform == "win32":
     tesseract_paths = [
@@ -41,34 +55,178 @@ if sys.platform == "win32":
             pytesseract.pytesseract.tesseract_cmd = path
             break
 
+# Tesseract settings shared by the tesseract CLI and tesserocr code paths
+# Receipts are numbers and codes rather than words, so skip the dictionaries
+_DAWG_VARIABLES = {"load_system_dawg": "0", "load_freq_dawg": "0"}
+_CHAR_BLACKLIST = '~`'
+_DAWG_CONFIG = ' '.join(f'-c {name}={value}' for name, value in _DAWG_VARIABLES.items())
+_TESSERACT_CONFIG = f'--oem 3 --psm 6 {_DAWG_CONFIG} -c tessedit_char_blacklist={_CHAR_BLACKLIST}'
+_TESSERACT_SPARSE_CONFIG = f'--oem 3 --psm 11 {_DAWG_CONFIG}'
+
+# Maximum number of images passed to one tesseract invocation in list mode;
+# very long image lists are known to make tesseract hang
+_OCR_BATCH_SIZE = 50
+
+# OCR text is cached on disk keyed by image content and OCR settings.
+# Bump _OCR_CACHE_VERSION whenever preprocessing changes the OCR output.
+# Both the in-memory and the on-disk cache are LRU with a fixed entry limit.
+_OCR_CACHE_DIR = Path.home() / ".cache" / "petrol_ocr"
+_OCR_CACHE_VERSION = "3"
+_OCR_CACHE_MAX_FILES = 500
+_OCR_MEMORY_CACHE_SIZE = 128
+_ocr_text_cache = OrderedDict()
+
+# Lazily created tesserocr API, reused for every image processed by this process;
+# _tess_api_failed is set when it could not be created, to stop retrying
+_tess_api = None
+_tess_api_failed = False
+
+# Use OpenCV's CUDA module for denoising and CLAHE when a GPU is available.
+# Detected on first use in each process (see _cuda_available), never at import.
+_cuda_enabled = None
+
+# Precompiled patterns used by extract_receipt_data
+_CR_TABLE = str.maketrans({'\r': '\n'})
+# Runs of spaces or of 3+ newlines, collapsed together in one substitution
+_WHITESPACE_RUN_RE = re.compile(r' {2,}|\n{3,}')
+
+_SERIAL_RE = re.compile(r'(\d{2}[A-Z]{2}\d{4}[A-Z]?)', re.IGNORECASE)
+_DATE_RES = [re.compile(p, re.IGNORECASE) for p in (
+    r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',  # DD-MM-YYYY or DD/MM/YYYY
+    r'(\d{1,2}[-/][A-Z]{3}[-/]\d{2,4})',  # DD-MMM-YYYY or DD-MMM-YY
+)]
+_TIME_RE = re.compile(r'(\d{1,2}:\d{2}:\d{2})')
+_MODEL_RE = re.compile(r'MODEL[:\s]+(\d{3,5})', re.IGNORECASE)
+_MODEL_FALLBACK_RE = re.compile(r'\b(\d{4})\b')
+
+# Matches "NOZZLE 1", "NOZZLE : 1", "NOZZLE-1", "NOZZLE NO: 1", "NOZZLE # 1"
+# and the common "NOZLE" OCR error
+_NOZZLE_LABEL = r'NOZ+LE\.?(?:\s*(?:NO|NUMBER|#)\.?)?\s*[:\-]?'
+_NOZZLE_FINDER = re.compile(_NOZZLE_LABEL + r'\s*(\d+)', re.IGNORECASE)
+
+# A, V and TOT SALES values of a nozzle block, matched together in one scan
+_FIELD_LABEL = r'\bA(?![A-Z])|\bV(?![A-Z])|(?:TOT\s*)?SALES'
+_FIELDS_RE = re.compile(
+    rf'(?P<label>{_FIELD_LABEL})\s*[:\-]?\s*(?P<num>[0-9][0-9.,]*)',
+    re.IGNORECASE
+)
+# A NOZZLE/A/V/SALES label at the end of a line, whose value OCR put on the next line
+_TRAILING_LABEL_RE = re.compile(
+    rf'(?:{_NOZZLE_LABEL}|(?:{_FIELD_LABEL})\s*[:\-]?)\s*$',
+    re.IGNORECASE
+)
+_NUMBER_RE = re.compile(r'([0-9]+(?:\.[0-9]+)?)')
+
+
+def _collapse_whitespace_run(match):
+    """
+    Replace a run of spaces with one space and a run of newlines with two.
+    """
+    return ' ' if match.group()[0] == ' ' else '\n\n'
+
+
+def _extract_nozzle_fields(block, nozzle_data):
+    """
+    Fill the empty A, V and TOT SALES fields of nozzle_data from the first
+    occurrence of each label in block.
+    """
+    for match in _FIELDS_RE.finditer(block):
+        label = match.group('label')[0].upper()
+        key = "a" if label == "A" else "v" if label == "V" else "totSales"
+        if not nozzle_data[key]:
+            nozzle_data[key] = match.group('num').replace(',', '').strip()
+            if nozzle_data["a"] and nozzle_data["v"] and nozzle_data["totSales"]:
+                break
+
+
+def _pick_avs(numbers):
+    """
+    Guess A, V and TOT SALES from unlabelled numbers, assuming A is the
+    largest, V the second largest and TOT SALES the smallest.
+    Returns them as strings; TOT SALES is "" when no candidate is plausible.
+    """
+    a, v = heapq.nlargest(2, numbers)
+    # TOT SALES is usually the smallest or a round number, and < 1 million
+    smallest = min(numbers)
+    tot_sales = str(int(smallest)) if smallest < 1000000 else ""
+    return str(a), str(v), tot_sales
+
+
+def _cuda_available():
+    """
+    Return whether the CUDA path can be used, querying the device count on
+    first call. Done lazily so that importing this module does not initialize
+    the CUDA driver, which would be unusable in forked child processes.
+    """
+    global _cuda_enabled
+    if _cuda_enabled is None:
+        try:
+            _cuda_enabled = cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except (AttributeError, cv2.error):
+            _cuda_enabled = False
+    return _cuda_enabled
+
+
+def _denoise_and_enhance(gray):
+    """
+    Denoise the grayscale image and increase contrast using CLAHE
+    (Contrast Limited Adaptive Histogram Equalization).
+    
+    A small bilateral filter is enough for printed receipts: it keeps text
+    edges sharp at a fraction of the cost of non-local means denoising, and
+    Tesseract copes well with the little noise that remains.
+    
+    On a CUDA device both stages run on the GPU with a single upload and
+    download; otherwise, or if the GPU path fails, they run on the CPU.
+    """
+    global _cuda_enabled
+    if _cuda_available():
+        try:
+            gpu_img = cv2.cuda_GpuMat()
+            gpu_img.upload(gray)
+            gpu_img = cv2.cuda.bilateralFilter(gpu_img, 5, 50, 50)
+            clahe = cv2.cuda.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+            gpu_img = clahe.apply(gpu_img, cv2.cuda_Stream.Null())
+            return gpu_img.download()
+        except (AttributeError, cv2.error) as e:
+            # AttributeError: CUDA build without the cudaimgproc module.
+            # Report once and stay on the CPU for the rest of this process.
+            _cuda_enabled = False
+            print(json.dumps({
+                "warning": f"CUDA preprocessing failed, using CPU: {str(e)}"
+            }), file=sys.stderr)
+    
+    denoised = cv2.bilateralFilter(gray, 5, 50, 50)
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    return clahe.apply(denoised)
+
 
 def preprocess_image(image_path):
     """
     Preprocess the image to improve OCR accuracy.
     """
     try:
-        # Read image
-        img = cv2.imread(image_path)
-        if img is None:
+        # Read image, decoding straight to a single grayscale channel
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
             raise ValueError(f"Could not read image from {image_path}")
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Resize if image is too small (helps OCR)
+        # Resize if image is too small (helps OCR) or much larger than needed
         height, width = gray.shape
         if width < 800:
             scale = 800 / width
             new_width = int(width * scale)
             new_height = int(height * scale)
             gray = cv2.resize(gray, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
+        elif width > 1600:
+            # Downscale large photos - printed receipt text stays legible and
+            # every later stage works on far fewer pixels
+            scale = 1600 / width
+            new_height = int(height * scale)
+            gray = cv2.resize(gray, (1600, new_height), interpolation=cv2.INTER_AREA)
         
-        # Apply denoising
-        denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-        
-        # Increase contrast using CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(denoised)
+        # Apply denoising and increase contrast
+        enhanced = _denoise_and_enhance(gray)
         
         # Apply adaptive thresholding for better text extraction
         binary = cv2.adaptiveThreshold(
@@ -80,7 +238,8 @@ def preprocess_image(image_path):
         _, binary_otsu = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
         # Use the one with more text (more white pixels usually means more text detected)
-        if np.sum(binary == 255) > np.sum(binary_otsu == 255):
+        # Both are strictly 0/255, so non-zero pixels are exactly the white ones
+        if cv2.countNonZero(binary) > cv2.countNonZero(binary_otsu):
             cleaned = binary
         else:
             cleaned = binary_otsu
@@ -97,6 +256,75 @@ def preprocess_image(image_path):
         return None
 
 
+def _get_tess_api():
+    """
+    Return the shared tesserocr API, creating it on first use.
+    Returns None if tesserocr is not installed or fails to initialize.
+    """
+    global _tess_api, _tess_api_failed
+    if _tess_api is None and PyTessBaseAPI is not None and not _tess_api_failed:
+        try:
+            # Dictionary loading is decided at init time, so pass it here
+            _tess_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.DEFAULT, variables=_DAWG_VARIABLES)
+        except RuntimeError:
+            # e.g. tessdata not found - use the tesseract CLI from now on
+            _tess_api_failed = True
+    return _tess_api
+
+
+def _run_tesseract_cli(args, input_bytes=None):
+    """
+    Run the tesseract CLI with args and return its decoded stdout. Failures
+    are raised as pytesseract's exceptions, carrying tesseract's stderr.
+    """
+    try:
+        completed = subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd] + args,
+            input=input_bytes,
+            capture_output=True,
+            check=True
+        )
+    except FileNotFoundError:
+        raise pytesseract.TesseractNotFoundError()
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode("utf-8", errors="replace").strip()
+        raise pytesseract.TesseractError(e.returncode, stderr)
+    return completed.stdout.decode("utf-8", errors="replace")
+
+
+def _run_tesseract(img, sparse=False):
+    """
+    Run Tesseract on a preprocessed image, either as a uniform block of
+    text (PSM 6) or as sparse text (PSM 11).
+    """
+    api = _get_tess_api()
+    if api is None:
+        # Pipe the image to the tesseract CLI as PGM: a raw header + pixels
+        # encoding, with no PNG compression and no temporary file
+        config = _TESSERACT_SPARSE_CONFIG if sparse else _TESSERACT_CONFIG
+        ok, pgm = cv2.imencode('.pgm', img)
+        if not ok:
+            raise ValueError("Could not encode image for Tesseract")
+        return _run_tesseract_cli(["stdin", "stdout"] + shlex.split(config), input_bytes=pgm.tobytes())
+    
+    api.SetPageSegMode(PSM.SPARSE_TEXT if sparse else PSM.SINGLE_BLOCK)
+    api.SetVariable("tessedit_char_blacklist", "" if sparse else _CHAR_BLACKLIST)
+    api.SetImage(Image.fromarray(img))
+    return api.GetUTF8Text()
+
+
+def _retry_sparse(img, text):
+    """
+    If the block OCR pass produced very little text, try the sparse text
+    PSM and keep whichever result is longer.
+    """
+    if len(text.strip()) < 100:
+        text_alt = _run_tesseract(img, sparse=True)
+        if len(text_alt.strip()) > len(text.strip()):
+            return text_alt
+    return text
+
+
 def extract_text_from_image(image_path):
     """
     Extract text from image using Tesseract OCR.
@@ -108,23 +336,13 @@ def extract_text_from_image(image_path):
             # Fallback to direct OCR on original image
             processed_img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
         
-        # Configure Tesseract for better accuracy
-        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,:/- '
-        
         # Extract text - try multiple PSM modes for better accuracy
         # PSM 6 = Assume uniform block of text
         # PSM 11 = Sparse text
         # PSM 12 = Sparse text with OSD
-        text = pytesseract.image_to_string(processed_img, config=custom_config)
-        
-        # If we get very little text, try alternative PSM
-        if len(text.strip()) < 100:
-            custom_config_alt = r'--oem 3 --psm 11'
-            text_alt = pytesseract.image_to_string(processed_img, config=custom_config_alt)
-            if len(text_alt.strip()) > len(text.strip()):
-                text = text_alt
+        text = _run_tesseract(processed_img)
         
-        return text
+        return _retry_sparse(processed_img, text)
     except Exception as e:
         print(json.dumps({
             "error": f"OCR extraction failed: {str(e)}"
@@ -141,10 +359,10 @@ def extract_receipt_data(text):
     
     # Normalize text - but preserve structure for nozzle extraction
     # Don't collapse all whitespace - keep some structure
-    normalized = re.sub(r'\r\n', '\n', text)
-    normalized = re.sub(r'\r', '\n', normalized)
-    normalized = re.sub(r' {2,}', ' ', normalized)  # Only collapse multiple spaces
-    normalized = re.sub(r'\n{3,}', '\n\n', normalized)  # Max 2 newlines
+    # CRLF must be folded before translating bare CRs, otherwise it becomes a blank line
+    normalized = text.replace('\r\n', '\n').translate(_CR_TABLE)
+    # Only collapse multiple spaces, and allow at most 2 newlines in a row
+    normalized = _WHITESPACE_RUN_RE.sub(_collapse_whitespace_run, normalized)
     
     result = {
         "pumpSerialNumber": "",
@@ -155,18 +373,13 @@ def extract_receipt_data(text):
     }
     
     # Extract Pump Serial Number (format: 12JB2792V or similar)
-    serial_match = re.search(r'(\d{2}[A-Z]{2}\d{4}[A-Z]?)', normalized, re.IGNORECASE)
+    serial_match = _SERIAL_RE.search(normalized)
     if serial_match:
         result["pumpSerialNumber"] = serial_match.group(1).upper()
     
     # Extract Print Date (format: DD-MMM-YYYY or DD-MMM-YY)
-    date_patterns = [
-        r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',  # DD-MM-YYYY or DD/MM/YYYY
-        r'(\d{1,2}[-/][A-Z]{3}[-/]\d{2,4})',  # DD-MMM-YYYY
-        r'(\d{1,2}[-/][A-Z]{3}[-/]\d{2,4})',  # DD-MMM-YY
-    ]
-    for pattern in date_patterns:
-        date_match = re.search(pattern, normalized, re.IGNORECASE)
+    for date_re in _DATE_RES:
+        date_match = date_re.search(normalized)
         if date_match:
             date_str = date_match.group(1)
             # Normalize date format
@@ -175,243 +388,177 @@ def extract_receipt_data(text):
             break
     
     # Extract Print Time (format: HH:MM:SS)
-    time_match = re.search(r'(\d{1,2}:\d{2}:\d{2})', normalized)
+    time_match = _TIME_RE.search(normalized)
     if time_match:
         result["printTime"] = time_match.group(1)
     
     # Extract Model (usually 4 digits like 2422)
-    model_match = re.search(r'MODEL[:\s]+(\d{3,5})', normalized, re.IGNORECASE)
+    model_match = _MODEL_RE.search(normalized)
     if not model_match:
-        model_match = re.search(r'\b(\d{4})\b', normalized)
+        model_match = _MODEL_FALLBACK_RE.search(normalized)
     if model_match:
         result["model"] = model_match.group(1)
     
-    # Extract nozzle data - ULTRA AGGRESSIVE approach to capture ALL nozzles including #1
+    # Extract nozzle data in a single line-oriented pass: a NOZZLE label switches
+    # the current nozzle and the A / V / TOT SALES values that follow belong to it
     found_nozzles = {}
+    nozzle_text = {}
+    current_nozzle = None
+    pending_label = ''
     
-    # CRITICAL: First, find ALL nozzle numbers in the text using multiple methods
-    nozzle_numbers_found = set()
-    
-    # Method 1: Standard NOZZLE pattern
-    for match in re.finditer(r'NOZZLE\s*[:\-]?\s*(\d+)', normalized, re.IGNORECASE):
-        nozzle_numbers_found.add(match.group(1))
-    
-    # Method 2: Common OCR errors
-    for match in re.finditer(r'NOZLE\s*[:\-]?\s*(\d+)', normalized, re.IGNORECASE):
-        nozzle_numbers_found.add(match.group(1))
-    
-    # Method 3: Look for patterns like "NOZZLE : 1" with colon
-    for match in re.finditer(r'NOZZLE\s*:\s*(\d+)', normalized, re.IGNORECASE):
-        nozzle_numbers_found.add(match.group(1))
-    
-    # Method 4: Look for just numbers near "NOZZLE" text (handles spacing issues)
-    for match in re.finditer(r'NOZZLE[^\d]*(\d)', normalized, re.IGNORECASE):
-        nozzle_numbers_found.add(match.group(1))
-    
-    # Initialize ALL found nozzles first
-    for nozzle_num in sorted(nozzle_numbers_found, key=lambda x: int(x) if x.isdigit() else 999):
-        found_nozzles[nozzle_num] = {
-            "nozzle": nozzle_num,
-            "a": "",
-            "v": "",
-            "totSales": ""
-        }
-    
-    # Now find all nozzle positions for block extraction
-    nozzle_positions = []
-    patterns = [
-        r'NOZZLE\s*[:\-]?\s*(\d+)',
-        r'NOZZLE\s*:\s*(\d+)',
-        r'NOZZLE\s+(\d+)',
-        r'NOZLE\s*[:\-]?\s*(\d+)',
-    ]
-    
-    for pattern in patterns:
-        for match in re.finditer(pattern, normalized, re.IGNORECASE):
-            nozzle_num = match.group(1)
-            if not any(p['number'] == nozzle_num for p in nozzle_positions):
-                nozzle_positions.append({
-                    'number': nozzle_num,
-                    'start': match.start(),
-                    'end': match.end()
-                })
-    
-    # Sort by position
-    nozzle_positions.sort(key=lambda x: x['start'])
-    
-    # IMPORTANT: If we found nozzle numbers but no positions, create positions manually
-    if nozzle_numbers_found and not nozzle_positions:
-        # Try to find each nozzle number in the text and create a position
-        for nozzle_num in nozzle_numbers_found:
-            # Look for the number near "NOZZLE" or just the number with A/V/SALES nearby
-            pattern = rf'(?:NOZZLE[^\d]*)?{nozzle_num}[\s\S]{{0,100}}A'
-            match = re.search(pattern, normalized, re.IGNORECASE)
-            if match:
-                nozzle_positions.append({
-                    'number': nozzle_num,
-                    'start': match.start(),
-                    'end': match.start() + 200  # Give it a block size
-                })
-    
-    # For each nozzle, extract its data block
-    for idx, nozzle_pos in enumerate(nozzle_positions):
-        nozzle_num = nozzle_pos['number']
-        
-        # Ensure this nozzle is in our found_nozzles dict
-        if nozzle_num not in found_nozzles:
-            found_nozzles[nozzle_num] = {
-                "nozzle": nozzle_num,
-                "a": "",
-                "v": "",
-                "totSales": ""
-            }
+    for line in normalized.split('\n'):
+        if not line.strip():
+            continue
         
-        nozzle_data = found_nozzles[nozzle_num]
+        # A label left dangling at the end of the previous line applies to this one
+        if pending_label:
+            line = f"{pending_label} {line}"
+        trailing_match = _TRAILING_LABEL_RE.search(line)
+        pending_label = trailing_match.group().strip() if trailing_match else ''
         
-        # Determine the end of this nozzle's block (start of next nozzle or end of text)
-        if idx + 1 < len(nozzle_positions):
-            block_end = nozzle_positions[idx + 1]['start']
-        else:
-            # For the last nozzle, look ahead more to catch all data
-            block_end = min(nozzle_pos['start'] + 500, len(normalized))
-        
-        # Extract the block for this nozzle - use larger block for first nozzle
-        if idx == 0:
-            # For nozzle 1, start from beginning of text or nozzle position, whichever is earlier
-            block_start = max(0, nozzle_pos['start'] - 50)  # Look back a bit too
-            nozzle_block = normalized[block_start:block_end]
-        else:
-            nozzle_block = normalized[nozzle_pos['start']:block_end]
-        
-        # Extract A value - try multiple patterns
-        a_patterns = [
-            r'A\s*[:\-]?\s*([0-9][0-9.,]*)',
-            r'A:\s*([0-9][0-9.,]*)',
-            r'A\s+([0-9][0-9.,]*)',
-            r'\bA\s*[:\-]?\s*([0-9]+\.[0-9]+)',
-        ]
-        for pattern in a_patterns:
-            a_match = re.search(pattern, nozzle_block, re.IGNORECASE)
-            if a_match:
-                nozzle_data["a"] = a_match.group(1).replace(',', '').strip()
-                break
-        
-        # Extract V value - try multiple patterns
-        v_patterns = [
-            r'V\s*[:\-]?\s*([0-9][0-9.,]*)',
-            r'V:\s*([0-9][0-9.,]*)',
-            r'V\s+([0-9][0-9.,]*)',
-            r'\bV\s*[:\-]?\s*([0-9]+\.[0-9]+)',
-        ]
-        for pattern in v_patterns:
-            v_match = re.search(pattern, nozzle_block, re.IGNORECASE)
-            if v_match:
-                nozzle_data["v"] = v_match.group(1).replace(',', '').strip()
-                break
-        
-        # Extract TOT SALES - try multiple patterns
-        sales_patterns = [
-            r'TOT\s*SALES\s*[:\-]?\s*([0-9][0-9.,]*)',
-            r'TOT\s*SALES:\s*([0-9][0-9.,]*)',
-            r'TOT\s*SALES\s+([0-9][0-9.,]*)',
-            r'TOT\s*SALES\s*[:\-]?\s*([0-9]+)',
-            r'SALES\s*[:\-]?\s*([0-9][0-9.,]*)',
-        ]
-        for pattern in sales_patterns:
-            sales_match = re.search(pattern, nozzle_block, re.IGNORECASE)
-            if sales_match:
-                nozzle_data["totSales"] = sales_match.group(1).replace(',', '').strip()
-                break
+        segment_start = 0
+        for match in _NOZZLE_FINDER.finditer(line):
+            if current_nozzle is not None:
+                segment = line[segment_start:match.start()]
+                _extract_nozzle_fields(segment, found_nozzles[current_nozzle])
+                nozzle_text[current_nozzle].append(segment)
+            current_nozzle = match.group(1)
+            if current_nozzle not in found_nozzles:
+                found_nozzles[current_nozzle] = {
+                    "nozzle": current_nozzle,
+                    "a": "",
+                    "v": "",
+                    "totSales": ""
+                }
+                nozzle_text[current_nozzle] = []
+            segment_start = match.end()
         
+        if current_nozzle is not None:
+            segment = line[segment_start:]
+            _extract_nozzle_fields(segment, found_nozzles[current_nozzle])
+            nozzle_text[current_nozzle].append(segment)
+    
+    for nozzle_num, nozzle_data in found_nozzles.items():
         # If still missing values, try extracting all numbers and assigning by position
         if not nozzle_data["a"] or not nozzle_data["v"] or not nozzle_data["totSales"]:
-            # Find all decimal numbers in the block
-            all_numbers = re.findall(r'([0-9]+(?:\.[0-9]+)?)', nozzle_block)
+            # Find all decimal numbers in this nozzle's text
+            all_numbers = _NUMBER_RE.findall('\n'.join(nozzle_text[nozzle_num]))
             
             # If we found numbers, try to assign them
             # Typically format is: A: big_number, V: medium_number, TOT SALES: small_number
-            if len(all_numbers) >= 3:
-                # Sort numbers by size (assuming A is largest, V is medium, TOT SALES is smallest)
-                numbers = [float(n.replace(',', '')) for n in all_numbers if '.' in n or len(n) > 3]
-                if len(numbers) >= 3:
-                    numbers.sort(reverse=True)
-                    if not nozzle_data["a"]:
-                        nozzle_data["a"] = str(numbers[0])
-                    if not nozzle_data["v"] and len(numbers) > 1:
-                        nozzle_data["v"] = str(numbers[1])
-                    if not nozzle_data["totSales"] and len(numbers) > 2:
-                        # TOT SALES is usually the smallest or a round number
-                        for n in reversed(numbers):
-                            if n < 1000000:  # TOT SALES is usually < 1 million
-                                nozzle_data["totSales"] = str(int(n))
-                                break
-    
-    # CRITICAL FIX: For any nozzles we found but didn't extract data for, search the entire text
-    for nozzle_num, nozzle_data in found_nozzles.items():
-        # If this nozzle has no data, search the entire normalized text for it
-        if not nozzle_data["a"] and not nozzle_data["v"] and not nozzle_data["totSales"]:
-            # Create a search pattern for this specific nozzle
-            search_pattern = rf'NOZZLE\s*[:\-]?\s*{nozzle_num}[\s\S]{{0,300}}'
-            match = re.search(search_pattern, normalized, re.IGNORECASE)
-            if match:
-                block = match.group(0)
-                # Try to extract values from this block
-                a_match = re.search(r'A\s*[:\-]?\s*([0-9][0-9.,]*)', block, re.IGNORECASE)
-                if a_match:
-                    nozzle_data["a"] = a_match.group(1).replace(',', '').strip()
-                v_match = re.search(r'V\s*[:\-]?\s*([0-9][0-9.,]*)', block, re.IGNORECASE)
-                if v_match:
-                    nozzle_data["v"] = v_match.group(1).replace(',', '').strip()
-                sales_match = re.search(r'TOT\s*SALES\s*[:\-]?\s*([0-9][0-9.,]*)', block, re.IGNORECASE)
-                if sales_match:
-                    nozzle_data["totSales"] = sales_match.group(1).replace(',', '').strip()
+            numbers = [float(n) for n in all_numbers if '.' in n or len(n) > 3]
+            if len(numbers) >= 3:
+                a, v, tot_sales = _pick_avs(numbers)
+                if not nozzle_data["a"]:
+                    nozzle_data["a"] = a
+                if not nozzle_data["v"]:
+                    nozzle_data["v"] = v
+                if not nozzle_data["totSales"]:
+                    nozzle_data["totSales"] = tot_sales
     
     # Convert to sorted list - ALWAYS include ALL found nozzles
-    result["nozzles"] = sorted(
-        [found_nozzles[key] for key in found_nozzles.keys()],
-        key=lambda x: int(x["nozzle"]) if x["nozzle"].isdigit() else 999
-    )
-    
-    # FINAL SAFEGUARD: If we found ANY nozzles but not all 4, check if we missed some
-    # This handles cases where OCR might have misread "NOZZLE" text
-    if result["nozzles"] and len(result["nozzles"]) < 4:
-        found_numbers = {int(n["nozzle"]) for n in result["nozzles"] if n["nozzle"].isdigit()}
-        expected_numbers = {1, 2, 3, 4}
-        missing_numbers = expected_numbers - found_numbers
-        
-        # For each missing nozzle, try to find it in the text with alternative patterns
-        for missing_num in missing_numbers:
-            # Try to find this nozzle number near "NOZZLE" text or in a similar pattern
-            # Look for patterns like "1", "2", etc. followed by A/V/TOT SALES patterns
-            missing_patterns = [
-                rf'\b{missing_num}\b[\s\S]{{0,200}}A\s*[:\-]?\s*([0-9][0-9.,]*)[\s\S]{{0,200}}V\s*[:\-]?\s*([0-9][0-9.,]*)[\s\S]{{0,200}}TOT\s*SALES\s*[:\-]?\s*([0-9][0-9.,]*)',
-                rf'NOZZLE[:\s]*{missing_num}[\s\S]{{0,300}}A[:\s]*([0-9][0-9.,]*)[\s\S]{{0,300}}V[:\s]*([0-9][0-9.,]*)[\s\S]{{0,300}}SALES[:\s]*([0-9][0-9.,]*)',
-            ]
-            
-            for pattern in missing_patterns:
-                match = re.search(pattern, normalized, re.IGNORECASE | re.DOTALL)
-                if match:
-                    nozzle_data = {
-                        "nozzle": str(missing_num),
-                        "a": match.group(1).replace(',', '').strip() if len(match.groups()) > 0 else "",
-                        "v": match.group(2).replace(',', '').strip() if len(match.groups()) > 1 else "",
-                        "totSales": match.group(3).replace(',', '').strip() if len(match.groups()) > 2 else ""
-                    }
-                    found_nozzles[str(missing_num)] = nozzle_data
-                    break
-        
-        # Re-sort after adding missing nozzles
-        result["nozzles"] = sorted(
-            [found_nozzles[key] for key in found_nozzles.keys()],
-            key=lambda x: int(x["nozzle"]) if x["nozzle"].isdigit() else 999
-        )
+    # (keys come from the (\d+) group of _NOZZLE_FINDER, so int() always succeeds)
+    result["nozzles"] = [found_nozzles[key] for key in sorted(found_nozzles, key=int)]
     
     return result
 
 
-def process_receipt(image_path):
+def _result_from_text(text):
+    """
+    Turn OCR text into the receipt result, or an error dict if there is
+    no text or no receipt data in it.
+    """
+    if not text:
+        return {
+            "error": "Failed to extract text from image"
+        }
+    
+    # Extract structured data
+    data = extract_receipt_data(text)
+    
+    if not data:
+        return {
+            "error": "Failed to extract receipt data from text"
+        }
+    
+    return data
+
+
+def _cache_key(image_path):
+    """
+    Return the OCR cache key for an image: a SHA-256 of its content and
+    the settings that affect the OCR output.
+    """
+    with open(image_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            digest = hashlib.file_digest(f, 'sha256')
+        else:
+            digest = hashlib.sha256(f.read())
+    digest.update(f"|{_OCR_CACHE_VERSION}|{_TESSERACT_CONFIG}|{_TESSERACT_SPARSE_CONFIG}".encode())
+    return digest.hexdigest()
+
+
+def _load_cached_text(cache_key):
+    """
+    Return the cached OCR text for cache_key, or None on a cache miss.
+    """
+    if cache_key in _ocr_text_cache:
+        _ocr_text_cache.move_to_end(cache_key)
+        return _ocr_text_cache[cache_key]
+    cache_file = _OCR_CACHE_DIR / f"{cache_key}.json"
+    try:
+        with open(cache_file) as f:
+            text = json.load(f)["text"]
+        # Mark as recently used so _prune_disk_cache keeps it
+        os.utime(cache_file)
+    except (OSError, ValueError, KeyError):
+        return None
+    _remember_text(cache_key, text)
+    return text
+
+
+def _remember_text(cache_key, text):
+    """
+    Add OCR text to the in-memory cache, evicting the least recently used entry.
+    """
+    _ocr_text_cache[cache_key] = text
+    _ocr_text_cache.move_to_end(cache_key)
+    if len(_ocr_text_cache) > _OCR_MEMORY_CACHE_SIZE:
+        _ocr_text_cache.popitem(last=False)
+
+
+def _prune_disk_cache():
+    """
+    Delete the least recently used cache files beyond _OCR_CACHE_MAX_FILES.
+    """
+    cache_files = list(_OCR_CACHE_DIR.glob("*.json"))
+    if len(cache_files) <= _OCR_CACHE_MAX_FILES:
+        return
+    cache_files.sort(key=lambda path: path.stat().st_mtime)
+    for path in cache_files[:len(cache_files) - _OCR_CACHE_MAX_FILES]:
+        path.unlink()
+
+
+def _store_cached_text(cache_key, text):
+    """
+    Cache the OCR text for cache_key in memory and on disk. Failing to write
+    the cache file is not an error.
+    """
+    _remember_text(cache_key, text)
+    try:
+        _OCR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_OCR_CACHE_DIR / f"{cache_key}.json", "w") as f:
+            json.dump({"text": text}, f)
+        _prune_disk_cache()
+    except OSError:
+        pass
+
+
+def process_receipt(image_path, use_cache=True):
     """
     Main function to process a receipt image and return extracted data.
+    With use_cache, OCR text from an earlier run on identical image content
+    is reused instead of running OCR again.
     """
     try:
         # Validate image path
@@ -420,23 +567,21 @@ def process_receipt(image_path):
                 "error": f"Image file not found: {image_path}"
             }
         
-        # Extract text from image
-        text = extract_text_from_image(image_path)
-        
-        if not text:
-            return {
-                "error": "Failed to extract text from image"
-            }
-        
-        # Extract structured data
-        data = extract_receipt_data(text)
+        cache_key = None
+        if use_cache:
+            try:
+                cache_key = _cache_key(image_path)
+            except OSError:
+                pass
+        text = _load_cached_text(cache_key) if cache_key else None
         
-        if not data:
-            return {
-                "error": "Failed to extract receipt data from text"
-            }
+        if text is None:
+            # Extract text from image
+            text = extract_text_from_image(image_path)
+            if text and cache_key:
+                _store_cached_text(cache_key, text)
         
-        return data
+        return _result_from_text(text)
         
     except Exception as e:
         return {
@@ -444,6 +589,150 @@ def process_receipt(image_path):
         }
 
 
+def _run_tesseract_list(images):
+    """
+    OCR several preprocessed images with a single tesseract CLI invocation,
+    using its image list input mode so the models are loaded only once.
+    Returns one text per image.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        list_path = os.path.join(tmp_dir, "images.txt")
+        with open(list_path, "w") as list_file:
+            for idx, img in enumerate(images):
+                img_path = os.path.join(tmp_dir, f"{idx}.pgm")
+                cv2.imwrite(img_path, img)
+                list_file.write(img_path + "\n")
+        
+        output = _run_tesseract_cli([list_path, "stdout"] + shlex.split(_TESSERACT_CONFIG))
+    
+    # Tesseract ends every page with a form feed
+    pages = output.split("\f")
+    if len(pages) < len(images):
+        # Page boundaries were lost - OCR each image on its own instead
+        pages = [_run_tesseract(img) for img in images]
+    return pages
+
+
+def _extract_texts_batch(image_paths):
+    """
+    Extract text from several images, loading the Tesseract models only once:
+    through the shared tesserocr API when available, otherwise with one
+    tesseract CLI invocation in image list mode.
+    Returns one text (or None if the image could not be read) per path.
+    """
+    images = []
+    for image_path in image_paths:
+        img = preprocess_image(image_path)
+        if img is None:
+            # Fallback to direct OCR on original image
+            img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        images.append(img)
+    
+    readable = [idx for idx, img in enumerate(images) if img is not None]
+    texts = [None] * len(images)
+    if not readable:
+        return texts
+    
+    if _get_tess_api() is not None:
+        pages = [_run_tesseract(images[idx]) for idx in readable]
+    else:
+        pages = _run_tesseract_list([images[idx] for idx in readable])
+    
+    for idx, page in zip(readable, pages):
+        texts[idx] = _retry_sparse(images[idx], page)
+    
+    return texts
+
+
+def _init_ocr_worker():
+    """
+    Pool initializer: limit each tesseract CLI run started by this worker to
+    one OpenMP thread, since images are already processed in parallel.
+    An in-process tesserocr is loaded before this runs, so callers wanting
+    the same for it must set OMP_THREAD_LIMIT before creating the pool.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _process_batch(image_paths, cache_keys):
+    """
+    OCR one batch of existing image files and return their results,
+    caching the OCR text under cache_keys (None entries are not cached).
+    """
+    try:
+        texts = _extract_texts_batch(image_paths)
+        for cache_key, text in zip(cache_keys, texts):
+            if text and cache_key:
+                _store_cached_text(cache_key, text)
+        return [_result_from_text(text) for text in texts]
+    except Exception as e:
+        return [{
+            "error": f"Error processing receipt: {str(e)}"
+        } for _ in image_paths]
+
+
+def process_receipts(image_paths, processes=None, use_cache=True):
+    """
+    Process several receipt images and return a list of results in the same
+    order as image_paths. Images are OCRed in batches of up to
+    _OCR_BATCH_SIZE per tesseract invocation, and batches are spread over
+    a pool of `processes` workers (default: half the CPU cores).
+    With use_cache, images already OCRed in an earlier run are not OCRed again.
+    """
+    results = [None] * len(image_paths)
+    cache_keys = [None] * len(image_paths)
+    pending = []
+    for idx, image_path in enumerate(image_paths):
+        if not os.path.exists(image_path):
+            results[idx] = {
+                "error": f"Image file not found: {image_path}"
+            }
+            continue
+        
+        if use_cache:
+            try:
+                cache_keys[idx] = _cache_key(image_path)
+            except OSError:
+                pass
+            text = _load_cached_text(cache_keys[idx]) if cache_keys[idx] else None
+            if text is not None:
+                results[idx] = _result_from_text(text)
+                continue
+        
+        pending.append(idx)
+    
+    if not pending:
+        return results
+    
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1) // 2)
+    processes = min(processes, len(pending))
+    
+    # Enough batches to keep every worker busy, none larger than _OCR_BATCH_SIZE
+    num_batches = max(processes, -(-len(pending) // _OCR_BATCH_SIZE))
+    batch_size = -(-len(pending) // num_batches)
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    batch_args = [
+        ([image_paths[idx] for idx in batch], [cache_keys[idx] for idx in batch])
+        for batch in batches
+    ]
+    
+    if processes > 1:
+        # Spawn rather than fork: a CUDA context created in this process
+        # cannot be used in forked children
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes, initializer=_init_ocr_worker) as pool:
+            batch_results = pool.starmap(_process_batch, batch_args)
+    else:
+        batch_results = [_process_batch(*args) for args in batch_args]
+    
+    for batch, batch_result in zip(batches, batch_results):
+        for idx, result in zip(batch, batch_result):
+            results[idx] = result
+    
+    return results
+
+
 def main():
     """
     Main entry point when script is run directly.
@@ -457,8 +746,8 @@ def main():
     
     image_path = sys.argv[1]
     
-    # Process receipt
-    result = process_receipt(image_path)
+    # Process receipt - the OCR cache is opt-in for the CLI used by the API
+    result = process_receipt(image_path, use_cache=os.environ.get("OCR_CACHE") == "true")
     
     # Output as JSON
     print(json.dumps(result, indent=2))
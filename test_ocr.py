@@ -6,17 +6,26 @@ without going through the API.
 
 Usage:
   python test_ocr.py <image_path>
+  python test_ocr.py <image_path> <image_path> ...   (batch mode)
 """
 
 import sys
 import os
 import json
 
+# In batch mode receipts are OCRed in parallel worker processes, so keep each
+# Tesseract single-threaded. Workers are spawned and import tesserocr (when
+# installed) before the pool initializer runs, and OpenMP only reads
+# OMP_THREAD_LIMIT when the library is loaded - so it has to be in the
+# environment the workers inherit from this process.
+if len(sys.argv) > 2:
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 # Add the project root to the path so we can import from lib
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from lib.receipt_processor import process_receipt
+    from lib.receipt_processor import process_receipt, process_receipts
 except ImportError:
     # Fallback: if import fails, try running as script
     import subprocess
@@ -32,23 +41,10 @@ except ImportError:
         else:
             return {"error": result.stderr or "Processing failed"}
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python test_ocr.py <image_path>")
-        sys.exit(1)
-    
-    image_path = sys.argv[1]
-    
-    if not os.path.exists(image_path):
-        print(f"Error: Image file not found: {image_path}")
-        sys.exit(1)
-    
-    print(f"Processing image: {image_path}")
-    print(f"File size: {os.path.getsize(image_path)} bytes")
-    
-    # Process the receipt
-    result = process_receipt(image_path)
-    
+    def process_receipts(image_paths):
+        return [process_receipt(image_path) for image_path in image_paths]
+
+def print_result(result):
     if result:
         print("\n=== OCR Results ===")
         print(json.dumps(result, indent=2))
@@ -68,8 +64,43 @@ def main():
                 print(f"  Total Sales: {nozzle.get('totSales', 'Not found')}")
         else:
             print("\nNo nozzle data found.")
+        return True
     else:
         print("Failed to process receipt")
+        return False
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python test_ocr.py <image_path> [<image_path> ...]")
+        sys.exit(1)
+    
+    image_paths = sys.argv[1:]
+    
+    for image_path in image_paths:
+        if not os.path.exists(image_path):
+            print(f"Error: Image file not found: {image_path}")
+            sys.exit(1)
+    
+    if len(image_paths) == 1:
+        image_path = image_paths[0]
+        print(f"Processing image: {image_path}")
+        print(f"File size: {os.path.getsize(image_path)} bytes")
+        
+        # Process the receipt
+        if not print_result(process_receipt(image_path)):
+            sys.exit(1)
+        return
+    
+    # Batch mode: OCR all receipts with as few tesseract runs as possible
+    print(f"Processing {len(image_paths)} images in batch mode")
+    results = process_receipts(image_paths)
+    
+    ok = True
+    for image_path, result in zip(image_paths, results):
+        print(f"\n##### {image_path} #####")
+        ok &= print_result(result)
+    
+    if not ok:
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+"""
+Regression tests for the OCR text parsing in lib/receipt_processor.py.
+
+Only extract_receipt_data is exercised, so no images or Tesseract are needed,
+but the module itself still requires the OCR packages from requirements.txt.
+
+Usage:
+  python -m unittest discover tests
+"""
+
+import importlib.util
+import os
+import sys
+import unittest
+
+# Add the project root to the path so we can import from lib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OCR_DEPS_INSTALLED = all(
+    importlib.util.find_spec(name) is not None
+    for name in ("cv2", "numpy", "PIL", "pytesseract")
+)
+
+if OCR_DEPS_INSTALLED:
+    from lib.receipt_processor import extract_receipt_data
+
+STANDARD_RECEIPT = """BHARAT PETROLEUM
+ETOT-MAIN
+12JB2792V MODEL: 2422
+05-MAR-2024 10:23:45
+
+NOZZLE : 1
+A: 1234567.89
+V: 98765.43
+TOT SALES: 4521
+
+NOZZLE : 2
+A: 2,234,567.10
+V: 88765.40
+TOT SALES: 3521
+NOZZLE 3
+A 334567.00
+V 7765.00
+TOT SALES 2521
+NOZLE: 4
+A:4567.1
+V:65.2
+TOT SALES:21
+"""
+
+
+def nozzle(number, a, v, tot_sales):
+    return {"nozzle": number, "a": a, "v": v, "totSales": tot_sales}
+
+
+@unittest.skipUnless(OCR_DEPS_INSTALLED, "OCR dependencies are not installed")
+class ExtractReceiptDataTest(unittest.TestCase):
+
+    def test_standard_layout(self):
+        result = extract_receipt_data(STANDARD_RECEIPT)
+        self.assertEqual(result["pumpSerialNumber"], "12JB2792V")
+        self.assertEqual(result["printDate"], "05-MAR-2024")
+        self.assertEqual(result["printTime"], "10:23:45")
+        self.assertEqual(result["model"], "2422")
+        self.assertEqual(result["nozzles"], [
+            nozzle("1", "1234567.89", "98765.43", "4521"),
+            nozzle("2", "2234567.10", "88765.40", "3521"),
+            nozzle("3", "334567.00", "7765.00", "2521"),
+            nozzle("4", "4567.1", "65.2", "21"),
+        ])
+
+    def test_crlf_and_cr_line_endings(self):
+        expected = extract_receipt_data(STANDARD_RECEIPT)
+        self.assertEqual(extract_receipt_data(STANDARD_RECEIPT.replace("\n", "\r\n")), expected)
+        self.assertEqual(extract_receipt_data(STANDARD_RECEIPT.replace("\n", "\r")), expected)
+
+    def test_inline_nozzles(self):
+        result = extract_receipt_data(
+            "12JB2792V 2422 05/03/2024 10:23:45\n"
+            "NOZZLE:1 A:100.5 V:200.5 TOT SALES:300 NOZZLE:2 A:110.5 V:210.5 TOT SALES:310\n"
+        )
+        self.assertEqual(result["printDate"], "05-03-2024")
+        # The V ending the serial number must not be read as nozzle 1's V value
+        self.assertEqual(result["nozzles"], [
+            nozzle("1", "100.5", "200.5", "300"),
+            nozzle("2", "110.5", "210.5", "310"),
+        ])
+
+    def test_unlabelled_numbers_fallback(self):
+        result = extract_receipt_data("NOZZLE 1\n123456.78 2345.67 8901\nNOZZLE 2\nA: 5.5\n")
+        self.assertEqual(result["nozzles"], [
+            nozzle("1", "123456.78", "8901.0", "2345"),
+            nozzle("2", "5.5", "", ""),
+        ])
+
+    def test_nozzle_label_word(self):
+        result = extract_receipt_data("NOZZLE NO : 1\nA: 100.5\nV: 20.3\nTOT SALES: 50\nNOZZLE # 2 A:1.5 V:2.5 SALES:3")
+        self.assertEqual(result["nozzles"], [
+            nozzle("1", "100.5", "20.3", "50"),
+            nozzle("2", "1.5", "2.5", "3"),
+        ])
+
+    def test_values_on_line_after_label(self):
+        result = extract_receipt_data("NOZZLE : 1\nA\n100.5\nV\n20.3\nTOT SALES\n50")
+        self.assertEqual(result["nozzles"], [nozzle("1", "100.5", "20.3", "50")])
+
+        result = extract_receipt_data("NOZZLE\n1\nA:\n123.4\nV: 5.5\nTOT SALES: 7")
+        self.assertEqual(result["nozzles"], [nozzle("1", "123.4", "5.5", "7")])
+
+    def test_no_phantom_nozzles(self):
+        result = extract_receipt_data("no nozzles here 12AB1234")
+        self.assertEqual(result["nozzles"], [])
+
+    def test_empty_text(self):
+        self.assertIsNone(extract_receipt_data(""))
+
+
+if __name__ == "__main__":
+    unittest.main()